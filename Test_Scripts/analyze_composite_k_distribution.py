@@ -14,9 +14,14 @@
 # the corrective mechanisms (like the Mod 210 system) need to fix.
 # ==============================================================================
 
-import math
 import time
-from collections import defaultdict
+
+import numpy as np
+
+from pac_common import (
+    SEARCH_LIMIT, cached_anchor_sums, cached_primes, check_search_coverage, first_seen, most_frequent_first,
+    scan_law_I_failures
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
@@ -28,135 +33,88 @@ LOOKUP_BUFFER = 10
 
 # --- Function to load primes from a file ---
 def load_primes_from_file(filename):
-    """Loads a list of primes from a text file."""
+    """Loads the primes from a text file as an int64 array."""
     print(f"Loading primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        primes_arr = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
         return None
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes in {end_time - start_time:.2f} seconds.")
-    return prime_list
-
-def is_prime(num, prime_set):
-    """Checks if a number is prime using the precomputed set."""
-    # Ensure we only check positive integers.
-    if num < 2:
-        return False
-    # Check against the set provided.
-    return num in prime_set
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
+    return primes_arr
+
+def warn_skipped_anchors(anchors_arr, skipped):
+    """Logs the anchors skipped because no prime lies within SEARCH_LIMIT."""
+    for i in skipped.tolist():
+        # Log warning if search limit is hit, indicating very large gap or issue.
+        print(f"\nWarning: Search distance exceeded limit ({SEARCH_LIMIT}) at index {i} (S_n={int(anchors_arr[i]):,}). Skipping.")
+
+# --- Statistics for the report ---
+def count_composite_k(k_values):
+    """
+    Returns (composite_k_counts, first_seen_k) for the Law I failures:
+    composite_k_counts[k] is the number of failures with k_min == k, and
+    first_seen_k[k] the position of the first of them.
+    """
+    return np.bincount(k_values, minlength=SEARCH_LIMIT + 1), first_seen(k_values, SEARCH_LIMIT + 1)
 
 # --- Main Testing Logic ---
 def analyze_k_distribution():
 
-    prime_list = load_primes_from_file(PRIME_INPUT_FILE)
-    if prime_list is None: return
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
+    anchors_arr = cached_anchor_sums(PRIME_INPUT_FILE)
 
     # Need N pairs + the next prime for S_N
     required_primes_count = MAX_PRIME_PAIRS_TO_TEST + 2
-    if len(prime_list) < required_primes_count:
+    if len(primes_arr) < required_primes_count:
         print("\nFATAL ERROR: The loaded prime file is too small for this test.")
         # Ensure sufficient primes are loaded to cover the test range.
         print(f"  Need at least {required_primes_count:,} primes.")
-        print(f"  Loaded only {len(prime_list):,} primes.")
+        print(f"  Loaded only {len(primes_arr):,} primes.")
         return
 
-    # --- *** prime_set CREATION *** ---
-    print("\nSafety check passed. Creating prime set for fast lookups...")
-    # Use ALL loaded primes for the set to ensure lookups near S_n work
-    if not prime_list:
-        print("FATAL ERROR: Prime list is empty after loading.")
+    # --- *** PRIME ARRAY CHECK *** ---
+    print("\nSafety check passed. Using the prime array for fast lookups...")
+    # Use ALL loaded primes for the array to ensure lookups near S_n work
+    if len(primes_arr) == 0:
+        print("FATAL ERROR: Prime array is empty after loading.")
         return
 
-    prime_set = set(prime_list)
-    max_prime_in_set = max(prime_list) if prime_list else 0
-    print(f"Prime set created using all {len(prime_set):,} loaded primes (up to {max_prime_in_set:,}). Starting analysis...")
+    max_prime_in_set = int(primes_arr[-1])
+    print(f"Prime array covers all {len(primes_arr):,} loaded primes (up to {max_prime_in_set:,}). Starting analysis...")
 
 
     print(f"\nStarting Composite k Distribution Analysis for {MAX_PRIME_PAIRS_TO_TEST:,} pairs...")
     print("-" * 80)
     start_time = time.time()
 
-    # --- Data structures for the analysis ---
-    total_law_I_failures = 0
-    composite_k_counts = defaultdict(int)
-
     # Start index from p2+p3 (index 1 in 0-based list)
     start_index = 1
+    loop_end_index = MAX_PRIME_PAIRS_TO_TEST + 1
 
-    for i in range(start_index, MAX_PRIME_PAIRS_TO_TEST + 1):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            # Update progress status.
-            print(f"Progress: {i:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails Found: {total_law_I_failures:,} | Time: {elapsed:.0f}s", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_sum = p_n + p_n_plus_1
-
-        # Check if potential lookups might exceed our loaded primes
-        # Add a buffer for the search distance (e.g., 2000)
-        max_lookup_needed = anchor_sum + 2000
-        if max_lookup_needed > max_prime_in_set:
-            print(f"\nFATAL ERROR: Anchor sum plus search distance ({max_lookup_needed:,}) exceeds largest prime in set ({max_prime_in_set:,}) at index {i}.")
-            print("Please generate a larger prime file.")
-            return # Stop execution if primes are insufficient
-
-        # --- 1. Find the k_min relative to S_n ---
-        min_distance_k = 0
-        search_dist = 1
-        found_prime = 0
-        while True:
-            # Increased safety break, typical gaps are < 2000 in this range
-            if search_dist > 2000:
-                # Log warning if search limit is hit, indicating very large gap or issue.
-                print(f"\nWarning: Search distance exceeded limit (2000) at index {i} (S_n={anchor_sum:,}). Skipping.")
-                min_distance_k = 0 # Ensure this case is skipped
-                break
-
-            q_lower = anchor_sum - search_dist
-            q_upper = anchor_sum + search_dist
-
-            # Check lower first
-            # We use is_prime which checks q_lower > 1 implicitly
-            if is_prime(q_lower, prime_set):
-                min_distance_k = search_dist
-                found_prime = q_lower
-                # Now check if upper is ALSO prime at the same distance
-                if is_prime(q_upper, prime_set):
-                     # If both are equidistant primes, Law I holds (k=prime distance)
-                     # The minimum distance *k* itself determines success/failure
-                     pass # Continue, k is found
-                break
-
-            # Check upper if lower wasn't prime
-            if is_prime(q_upper, prime_set):
-                min_distance_k = search_dist
-                found_prime = q_upper
-                break
-
-            search_dist += 1
-
-        if min_distance_k == 0: continue # Skip if search limit hit or other issue
-
-        # --- 2. Check if this k_min constitutes a Law I failure ---
-        # Law I holds if k_min is 1 OR if k_min is prime
-        # We need to check if min_distance_k itself is in the prime set
-        is_law_I_success = (min_distance_k == 1) or is_prime(min_distance_k, prime_set)
-
-        if not is_law_I_success:
-            # This is a Law I failure, k_min must be composite
-            total_law_I_failures += 1
-            composite_k_counts[min_distance_k] += 1
+    if not check_search_coverage(primes_arr, anchors_arr, start_index, loop_end_index):
+        return # Stop execution if primes are insufficient
+
+    # --- Data structures for the analysis ---
+    (_, _, _, k_values), skipped = scan_law_I_failures(PRIME_INPUT_FILE, start_index, loop_end_index)
+    warn_skipped_anchors(anchors_arr, skipped)
+    composite_k_counts, first_seen_k = count_composite_k(k_values)
+    total_law_I_failures = int(composite_k_counts.sum())
 
     # Final progress print after loop completion.
     print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails Found: {total_law_I_failures:,}   ")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    print_k_distribution_report(composite_k_counts, first_seen_k)
+
+def print_k_distribution_report(composite_k_counts, first_seen_k):
+    """Prints the frequency table of the composite k values."""
+    total_law_I_failures = int(composite_k_counts.sum())
+
     # --- Final Reports ---
     print("\n" + "="*20 + " Composite k Distribution Report " + "="*20)
     print(f"\nTotal Law I Failures (Composite k) Analyzed: {total_law_I_failures:,}")
@@ -170,7 +128,8 @@ def analyze_k_distribution():
     print("-" * 55)
 
     # Sort items by count (most frequent first)
-    sorted_k = sorted(composite_k_counts.items(), key=lambda item: item[1], reverse=True)
+    observed_k = most_frequent_first(composite_k_counts, first_seen_k)
+    sorted_k = [(int(k), int(composite_k_counts[k])) for k in observed_k]
 
     # Print the top 20 most frequent composite k values
     printed_count = 0
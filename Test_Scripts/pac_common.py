@@ -0,0 +1,333 @@
+# ==============================================================================
+# PRIMORIAL ANCHOR CONJECTURE (PAC) - SHARED LAW I FAILURE KERNEL
+#
+# The composite k distribution, PAC-2 and PAC-3 scripts all run the same
+# search: for every anchor S_n = p_n + p_{n+1}, find the nearest prime q
+# and keep the anchors whose distance k_min = |S_n - q| is composite.
+#
+# That search lives here once, so every script (and the fused runner in
+# 'run_all_pac_analyses.py') finds exactly the same Law I failures and
+# only reports different statistics about them.
+# ==============================================================================
+
+import functools
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+# --- Configuration ---
+# Increased safety break, typical gaps are < 2000 in this range
+SEARCH_LIMIT = 2000
+# Anchors per worker task, and number of worker processes
+CHUNK_SIZE = 1000000
+# Anchors per call of a block kernel: at 2^16 each int64 array of a block
+# is 512 KB, so the block's slices and temporaries stay close to L2
+BLOCK_SIZE = 1 << 16
+# Seconds between progress updates (checked once per finished block)
+PROGRESS_INTERVAL = 1.0
+NUM_WORKERS = os.cpu_count()
+
+# --- Binary caches of the prime file, the S_n anchors and the gaps g_n ---
+# Both are memoized per process, so scripts that share a run (see
+# 'run_all_pac_analyses.py') load each file only once.
+@functools.cache
+def cached_primes(path):
+    """
+    Returns the primes in the text file 'path' as an int64 array.
+    The first run parses the text once and saves it beside it as .npy;
+    later runs memory-map that file instead of re-parsing.
+    """
+    npy_path = os.path.splitext(path)[0] + ".npy"
+    if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(path):
+        primes_arr = np.load(npy_path, mmap_mode='r')
+        # S_n = p_n + p_{n+1} overflows 32 bits near 10^9, so anything
+        # but a flat int64 cache is rebuilt from the text file.
+        if primes_arr.dtype == np.int64 and primes_arr.ndim == 1:
+            return primes_arr
+    primes_arr = np.loadtxt(path, dtype=np.int64, ndmin=1)
+    np.save(npy_path, primes_arr)
+    return primes_arr
+
+@functools.cache
+def cached_anchor_sums(primes_path):
+    """
+    Returns S_n = p_n + p_{n+1} for every n as an int64 array.
+    The sums are saved once beside the prime file as *_anchors.npy, so
+    every script memory-maps the same anchors instead of re-adding them.
+    """
+    primes_arr = cached_primes(primes_path)
+    npy_path = os.path.splitext(primes_path)[0] + "_anchors.npy"
+    if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(primes_path):
+        anchors_arr = np.load(npy_path, mmap_mode='r')
+        if anchors_arr.dtype == np.int64 and anchors_arr.shape == (len(primes_arr) - 1,):
+            return anchors_arr
+    anchors_arr = primes_arr[:-1] + primes_arr[1:]
+    np.save(npy_path, anchors_arr)
+    return anchors_arr
+
+@functools.cache
+def cached_prime_gaps(primes_path):
+    """
+    Returns g_n = p_{n+1} - p_n for every n as an int16 array.
+    Like the anchors, the gaps are saved once beside the prime file (as
+    *_gaps.npy) and memory-mapped by every later run.
+    """
+    primes_arr = cached_primes(primes_path)
+    npy_path = os.path.splitext(primes_path)[0] + "_gaps.npy"
+    if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(primes_path):
+        gaps_arr = np.load(npy_path, mmap_mode='r')
+        if gaps_arr.dtype == np.int16 and gaps_arr.shape == (len(primes_arr) - 1,):
+            return gaps_arr
+    # Prime gaps below 10^10 stay under 400, far inside int16
+    gaps_arr = np.diff(primes_arr).astype(np.int16)
+    np.save(npy_path, gaps_arr)
+    return gaps_arr
+
+# --- Small-k primality table ---
+def small_prime_table(limit):
+    """Returns a boolean table with table[k] == (k is prime) for 0 <= k <= limit."""
+    table = np.ones(limit + 1, dtype=bool)
+    table[:2] = False
+    for p in range(2, math.isqrt(limit) + 1):
+        if table[p]:
+            table[p * p::p] = False
+    return table
+
+# k_min never exceeds the search limit, so this table covers every lookup
+K_IS_PRIME = small_prime_table(SEARCH_LIMIT)
+
+# --- Packed primality bitmap (one bit per odd integer) ---
+# Every prime but 2 is odd, so bit x >> 1 of the packed array records
+# whether the odd integer x is a listed prime: 1/16 the size of a
+# one-byte-per-integer bitmap.
+def odd_prime_bits(primes_arr):
+    """Returns the packed odd-integer bitmap of the primes in primes_arr."""
+    positions = primes_arr[np.searchsorted(primes_arr, 3):] >> 1
+    n_bits = int(primes_arr[-1]) // 2 + 1
+    bits = np.empty((n_bits + 7) // 8, dtype=np.uint8)
+    # Pack a bounded span of bits at a time to keep the bool scratch small
+    span = 1 << 24
+    for lo in range(0, n_bits, span):
+        hi = min(lo + span, n_bits)
+        a, b = np.searchsorted(positions, [lo, hi])
+        chunk = np.zeros(hi - lo, dtype=bool)
+        chunk[positions[a:b] - lo] = True
+        bits[lo // 8:(hi + 7) // 8] = np.packbits(chunk, bitorder='little')
+    return bits
+
+def prime_bit(bits, x):
+    """
+    Returns 1 where x (a scalar or array) is an odd listed prime, else 0.
+    Even x always give 0, which is only wrong for x == 2.
+    """
+    return (bits[x >> 4] >> ((x >> 1) & 7)) & 1 & (x & 1)
+
+def bracketing_primes(primes_arr, anchors):
+    """
+    Returns the (previous, next) primes around each anchor of a sorted block.
+    The block's span is located first, so the per-anchor binary searches
+    only walk the small window of primes around it.
+    """
+    lo = int(np.searchsorted(primes_arr, anchors[0])) - 1
+    hi = int(np.searchsorted(primes_arr, anchors[-1])) + 1
+    window = primes_arr[lo:hi]
+    window_idx = np.searchsorted(window, anchors)
+    return window[window_idx - 1], window[window_idx]
+
+def nearest_prime_distance(primes_arr, anchors):
+    """
+    Returns (k_min, lower_first) for a sorted block of even anchors: the
+    distance to the nearest prime, and whether that prime is the one below.
+    We must pick the lower prime in a tie, as it's the canonical "closest"
+    prime.
+    """
+    # S_n is even (> 2), so it always lies strictly between two primes.
+    # The bracket arrays are fresh copies, so they are reused in place
+    # as the distances below and above each anchor.
+    dist_below, dist_above = bracketing_primes(primes_arr, anchors)
+    np.subtract(anchors, dist_below, out=dist_below)
+    np.subtract(dist_above, anchors, out=dist_above)
+    lower_first = dist_below <= dist_above
+    return np.minimum(dist_below, dist_above, out=dist_below), lower_first
+
+def check_search_coverage(primes_arr, anchors_arr, start_index, stop_index, search_limit=SEARCH_LIMIT):
+    """
+    Checks that every anchor S_i (start_index <= i < stop_index) plus the
+    search distance stays within the loaded primes, so every nearest-prime
+    lookup is valid. Prints the FATAL error and returns False otherwise.
+    Drivers run it before starting a pool: past the last prime, the
+    bracket lookup would fail inside a worker instead.
+    """
+    max_prime_in_set = int(primes_arr[-1])
+    # Check if potential lookups might exceed our loaded primes
+    # Add a buffer for the search distance (e.g., 2000)
+    last_anchor_sum = int(anchors_arr[stop_index - 1])
+    if last_anchor_sum + search_limit > max_prime_in_set:
+        # Anchors are increasing, so the first offending one is the first True.
+        anchor_sums = anchors_arr[start_index:stop_index]
+        j = int(np.argmax(anchor_sums + search_limit > max_prime_in_set))
+        max_lookup_needed = int(anchor_sums[j]) + search_limit
+        print(f"\nFATAL ERROR: Anchor sum plus search distance ({max_lookup_needed:,}) exceeds largest prime in set ({max_prime_in_set:,}) at index {j + start_index}.")
+        print("Please generate a larger prime file.")
+        return False
+    return True
+
+# --- Numeric kernel for a block of anchors ---
+def find_law_I_failures(primes_arr, anchors_arr, start, stop):
+    """
+    Finds the Law I failures (composite k_min) of the anchors S_i for
+    start <= i < stop. Returns (n_index, S_n, q_prime, k) arrays, plus the
+    indices of the anchors skipped for having no prime within SEARCH_LIMIT.
+    """
+    anchors = anchors_arr[start:stop]
+
+    # --- 1. Find the k_min relative to S_n ---
+    min_distance_k, lower_first = nearest_prime_distance(primes_arr, anchors)
+
+    # Anchors beyond the search limit are skipped; the caller decides
+    # whether to report them (workers never print)
+    over_limit = min_distance_k > SEARCH_LIMIT
+    skipped = np.flatnonzero(over_limit) + start
+    min_distance_k[over_limit] = 0
+
+    # --- 2. Check if this k_min constitutes a Law I failure ---
+    # Law I holds if k_min is 1 OR if k_min is prime, so a failure
+    # means k_min is composite (skipped anchors have k_min == 0).
+    rows = np.flatnonzero((min_distance_k > 1) & ~K_IS_PRIME[min_distance_k])
+
+    # Only the failures need their index and nearest prime q = S_n -/+ k
+    anchors = anchors[rows]
+    k_values = min_distance_k[rows]
+    q_primes = np.where(lower_first[rows], anchors - k_values, anchors + k_values)
+    return rows + start, anchors, q_primes, k_values, skipped
+
+# --- Failure events as a structured array (one row per event) ---
+# The violation logs of the classifier tests are arrays of these records
+FAILURE_EVENT_DTYPE = np.dtype([
+    ("n_index", np.int64),
+    ("S_n", np.int64),
+    ("q_prime", np.int64),
+    ("k_composite", np.int32)
+])
+
+def failure_events(rows, n_index, anchors, q_primes, k_values):
+    """Builds the structured array of failure events for the selected rows."""
+    events = np.empty(np.count_nonzero(rows), dtype=FAILURE_EVENT_DTYPE)
+    events["n_index"] = n_index[rows]
+    events["S_n"] = anchors[rows]
+    events["q_prime"] = q_primes[rows]
+    events["k_composite"] = k_values[rows]
+    return events
+
+# --- Law III correlation CSV (written by test-5-data, read by test-5-correlation-analysis) ---
+# The primorial signatures of S_n and S_fix are packed into the one int64
+# 'signature' column, one byte per residue: (signature >> shift) & 0xFF
+SIGNATURE_SHIFTS = {
+    'Sn_mod6': 0, 'Sn_mod30': 8, 'Sn_mod210': 16,
+    'Sfix_mod6': 32, 'Sfix_mod30': 40, 'Sfix_mod210': 48
+}
+
+# --- Report ordering of histogram bins ---
+# The reports list k values by count. Equal counts keep the order in which
+# the bins were first seen during the scan, as the original dict counters did.
+def first_seen(bins, n_bins):
+    """
+    Returns first[b], the position of the first occurrence of bin b in
+    'bins' (len(bins) for bins that never occur).
+    """
+    first = np.full(n_bins, len(bins), dtype=np.int64)
+    seen_bins, first_idx = np.unique(bins, return_index=True)
+    first[seen_bins] = first_idx
+    return first
+
+def most_frequent_first(counts, first):
+    """
+    Returns the bins with nonzero counts, most frequent first; equal counts
+    are ordered by their first[] position.
+    """
+    observed = np.flatnonzero(counts)
+    return observed[np.lexsort((first[observed], -counts[observed]))]
+
+# --- Worker pool over anchor index blocks ---
+# Workers are handed the prime file's path, not its arrays: each one maps
+# the same on-disk .npy caches, so the OS page cache holds the only copy
+# whether the pool forks or spawns (which would pickle the arrays).
+# A script supplies a block kernel and a loader for the kernel's leading
+# arguments; both must be module-level functions so the pool can send them.
+_worker_kernel = None
+_worker_state = ()
+
+def _init_worker(kernel, load_state, state_args):
+    global _worker_kernel, _worker_state
+    _worker_kernel = kernel
+    _worker_state = load_state(*state_args)
+
+def _work(block):
+    start, stop = block
+    return _worker_kernel(*_worker_state, start, stop)
+
+def primes_through(primes_arr, upper):
+    """
+    Returns how many leading primes cover every prime <= upper plus the
+    one after it, so a worker can be given just that prefix of the file.
+    """
+    return int(np.searchsorted(primes_arr, upper, side='right')) + 1
+
+def load_prime_arrays(primes_path, primes_count, anchors_count):
+    """Returns the first primes_count primes and anchors_count anchors of the prime file."""
+    return cached_primes(primes_path)[:primes_count], cached_anchor_sums(primes_path)[:anchors_count]
+
+def index_chunks(start, stop, size):
+    """Splits [start, stop) into pieces of 'size' indices for the worker pool."""
+    return [(i, min(i + size, stop)) for i in range(start, stop, size)]
+
+def imap_blocks(kernel, load_state, state_args, start, stop, block_size, progress=None):
+    """
+    Runs kernel(*state, block_start, block_stop) over [start, stop) in
+    pieces of block_size on a pool of NUM_WORKERS processes, where each
+    worker builds 'state' once as load_state(*state_args). Yields
+    ((block_start, block_stop), result) in index order.
+
+    After a block has been handled, progress(block_stop) is called at most
+    once per PROGRESS_INTERVAL seconds. Leaving the loop early stops the pool.
+    """
+    blocks = index_chunks(start, stop, block_size)
+    last_progress_time = time.time()
+    with multiprocessing.Pool(NUM_WORKERS, initializer=_init_worker,
+                              initargs=(kernel, load_state, state_args)) as pool:
+        for block, result in zip(blocks, pool.imap(_work, blocks)):
+            yield block, result
+            if progress is None or time.time() - last_progress_time < PROGRESS_INTERVAL:
+                continue
+            last_progress_time = time.time()
+            progress(block[1])
+
+def scan_law_I_failures(primes_path, start, stop):
+    """
+    Runs find_law_I_failures over the anchors [start, stop) of the prime
+    file 'primes_path' on a pool of NUM_WORKERS processes. Returns
+    (failures, skipped): the concatenated (n_index, S_n, q_prime, k)
+    arrays, and the indices of the anchors skipped over SEARCH_LIMIT.
+    Progress is printed between chunks, outside the numeric kernel.
+    """
+    # Workers only see the primes up to the last anchor's search window
+    # (plus the prime after it), not the whole file.
+    upper = int(cached_anchor_sums(primes_path)[stop - 1]) + SEARCH_LIMIT
+    primes_count = primes_through(cached_primes(primes_path), upper)
+    chunk_failures = []
+    total_failures = 0
+
+    def print_progress(chunk_stop):
+        print(f"Progress: {chunk_stop - start:,} / {stop - start:,} "
+              f"| Law I Fails: {total_failures:,}", end='\r')
+
+    chunks = imap_blocks(find_law_I_failures, load_prime_arrays, (primes_path, primes_count, stop),
+                         start, stop, CHUNK_SIZE, print_progress)
+    for _, failures in chunks:
+        chunk_failures.append(failures)
+        total_failures += len(failures[0])
+    *failures, skipped = (np.concatenate(column) for column in zip(*chunk_failures))
+    return tuple(failures), skipped
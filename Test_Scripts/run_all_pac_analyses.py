@@ -0,0 +1,99 @@
+# ==============================================================================
+# PRIMORIAL ANCHOR CONJECTURE (PAC) - FUSED RUNNER
+#
+# Runs PAC-1, PAC-2, PAC-3 and the composite k distribution analysis
+# from a single pass over the data:
+# 1. The prime file is loaded once.
+# 2. The Law I failure search (pac_common.scan_law_I_failures) runs once
+#    over the union of the S_n ranges the scripts test.
+# 3. Each analysis takes its own slice of the failures and prints the
+#    same report as its standalone script.
+# ==============================================================================
+
+import importlib
+import time
+
+import numpy as np
+
+from pac_common import cached_anchor_sums, check_search_coverage, scan_law_I_failures
+
+# The test scripts are not valid module names, so they are imported by name.
+pac_cfr = importlib.import_module("test-1-pac-cfr")
+pac_classifier = importlib.import_module("test-2-pac-classifier")
+pac_residue = importlib.import_module("test-3-residue-analysis")
+k_distribution = importlib.import_module("analyze_composite_k_distribution")
+
+# --- Configuration ---
+PRIME_INPUT_FILE = "primes_100m.txt"
+
+def failures_in_range(failures, start, stop):
+    """Returns the Law I failures whose anchor index n lies in [start, stop)."""
+    n_index = failures[0]
+    lo, hi = np.searchsorted(n_index, [start, stop])
+    return tuple(column[lo:hi] for column in failures)
+
+# --- Main Testing Logic ---
+def run_all_pac_analyses():
+
+    primes_arr = k_distribution.load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
+
+    # S_n ranges of each analysis: [start, stop)
+    k_distribution_range = (1, k_distribution.MAX_PRIME_PAIRS_TO_TEST + 1)
+    classifier_range = (
+        pac_classifier.START_INDEX,
+        pac_classifier.MAX_PRIME_PAIRS_TO_TEST + pac_classifier.START_INDEX
+    )
+    residue_range = (
+        pac_residue.START_INDEX,
+        pac_residue.MAX_PRIME_PAIRS_TO_TEST + pac_residue.START_INDEX
+    )
+    scan_stop = max(k_distribution_range[1], classifier_range[1], residue_range[1])
+
+    # Same margin the standalone scripts require beyond the last anchor
+    required_primes = scan_stop + 10
+    if len(primes_arr) < required_primes:
+        print(f"\nFATAL ERROR: Prime file is too small.")
+        print(f"  Need at least {required_primes:,} primes.")
+        print(f"  Loaded only {len(primes_arr):,} primes.")
+        return
+
+    # The workers' nearest-prime lookups must stay inside the prime file
+    anchors_arr = cached_anchor_sums(PRIME_INPUT_FILE)
+    if not check_search_coverage(primes_arr, anchors_arr, 1, scan_stop):
+        return
+
+    print(f"\nStarting fused PAC analyses over {scan_stop - 1:,} S_n pairs...")
+    print("-" * 80)
+    start_time = time.time()
+
+    # --- One Law I failure search shared by every S_n analysis ---
+    failures, skipped = scan_law_I_failures(PRIME_INPUT_FILE, 1, scan_stop)
+
+    # Only the composite k distribution analysis reports skipped anchors
+    lo, hi = np.searchsorted(skipped, k_distribution_range)
+    k_distribution.warn_skipped_anchors(anchors_arr, skipped[lo:hi])
+
+    _, _, _, k_values = failures_in_range(failures, *k_distribution_range)
+    composite_k_counts, first_seen_k = k_distribution.count_composite_k(k_values)
+
+    suite = pac_classifier.run_classifier_suite(*failures_in_range(failures, *classifier_range))
+
+    _, anchors, _, k_values = failures_in_range(failures, *residue_range)
+    residue_failures = len(k_values)
+    failures_by_residue, first_seen_by_residue = pac_residue.classify_by_residue(anchors, k_values)
+
+    # --- PAC-1 tests the primes themselves, not the anchors ---
+    failure_counts, total_primes_tested = pac_cfr.run_cfr_suite(primes_arr[:pac_cfr.MAX_PRIMES_TO_TEST])
+
+    print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
+    print("-" * 80)
+
+    # --- Final Reports ---
+    pac_cfr.print_cfr_report(failure_counts, total_primes_tested)
+    pac_classifier.print_classifier_report(suite)
+    pac_residue.print_residue_report(residue_failures, failures_by_residue, first_seen_by_residue)
+    k_distribution.print_k_distribution_report(composite_k_counts, first_seen_k)
+
+if __name__ == "__main__":
+    run_all_pac_analyses()
@@ -13,8 +13,10 @@
 # ==============================================================================
 
 import time
-import math
-from collections import defaultdict
+
+import numpy as np
+
+from pac_common import cached_primes, small_prime_table
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt" 
@@ -24,51 +26,39 @@ MAX_PRIMES_TO_TEST = 50000000 # Use the first 50M primes
 def load_primes_from_file(filename, max_count):
     print(f"Loading primes from {filename}...")
     start_time = time.time()
-    prime_list = []
     try:
-        with open(filename, 'r') as f:
-            for i, line in enumerate(f):
-                if i >= max_count:
-                    break
-                prime_list.append(int(line.strip()))
+        primes_arr = cached_primes(filename)[:max_count]
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
-    return prime_list, prime_set
-
-# --- Helper function for the test ---
-def get_closest_anchor(q, primorial):
-    """Finds the closest multiple of the primorial to q."""
-    # (q // primorial) * primorial -> gives the multiple *below* q
-    # We must also check the multiple *above* q.
-    
-    A_below = (q // primorial) * primorial
-    A_above = A_below + primorial
-    
-    if (q - A_below) < (A_above - q):
-        return A_below
-    else:
-        return A_above
-
-# --- Main Testing Logic ---
-def run_PAC_CFR_test():
-    
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE, MAX_PRIMES_TO_TEST)
-    if prime_list is None: return
-
-    print(f"\nStarting PAC Composite Failure Rate (CFR) Test...")
-    print(f"Testing {len(prime_list):,} total primes.")
-    print("-" * 80)
-    start_time = time.time()
-
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
+    return primes_arr
+
+# --- Small-k primality table ---
+# k = |A_k - q| is at most half of the largest primorial tested (210)
+K_IS_PRIME = small_prime_table(210 // 2)
+
+# --- Numeric kernel for one primorial system ---
+def count_cfr_failures(primes_to_test, primorial):
+    """Counts the primes q whose distance k to the closest P_k anchor is composite."""
+    # With r = q % primorial, the multiple *below* q is r away and the
+    # multiple *above* q is (primorial - r) away; k is the smaller one.
+    r = primes_to_test % primorial
+    k = np.minimum(r, primorial - r)
+    is_failure = (k > 1) & ~K_IS_PRIME[k]
+    return int(np.count_nonzero(is_failure))
+
+def run_cfr_suite(primes_arr):
+    """
+    Counts the composite k failures of every prime q > 7 against each
+    primorial system. Returns ({primorial: failures}, total_primes_tested).
+    """
     # --- Data structures for the CFR Test ---
     # We will count the total number of composite k's found for each system.
     # We skip the first few primes (2, 3, 5, 7) for a fair test.
-    primes_to_test = [p for p in prime_list if p > 7]
+    primes_to_test = primes_arr[primes_arr > 7]
     total_primes_tested = len(primes_to_test)
     
     failure_counts = {
@@ -77,34 +67,33 @@ def run_PAC_CFR_test():
         210: 0  # P_4
     }
 
-    # --- Loop through every prime 'q' ---
-    for i, q in enumerate(primes_to_test):
-        
-        if (i + 1) % 100000 == 0:
-            print(f"Progress: {i+1:,} / {total_primes_tested:,}", end='\r')
-
-        # --- Test System P_2 (Mod 6) ---
-        A_6 = get_closest_anchor(q, 6)
-        k_6 = abs(A_6 - q)
-        if (k_6 > 1) and (k_6 not in prime_set):
-            failure_counts[6] += 1
-
-        # --- Test System P_3 (Mod 30) ---
-        A_30 = get_closest_anchor(q, 30)
-        k_30 = abs(A_30 - q)
-        if (k_30 > 1) and (k_30 not in prime_set):
-            failure_counts[30] += 1
-
-        # --- Test System P_4 (Mod 210) ---
-        A_210 = get_closest_anchor(q, 210)
-        k_210 = abs(A_210 - q)
-        if (k_210 > 1) and (k_210 not in prime_set):
-            failure_counts[210] += 1
+    # --- Test every prime 'q' against each system at once ---
+    # P_2 (Mod 6), P_3 (Mod 30) and P_4 (Mod 210)
+    for primorial in failure_counts:
+        failure_counts[primorial] = count_cfr_failures(primes_to_test, primorial)
+    return failure_counts, total_primes_tested
+
+# --- Main Testing Logic ---
+def run_PAC_CFR_test():
+    
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE, MAX_PRIMES_TO_TEST)
+    if primes_arr is None: return
+
+    print(f"\nStarting PAC Composite Failure Rate (CFR) Test...")
+    print(f"Testing {len(primes_arr):,} total primes.")
+    print("-" * 80)
+    start_time = time.time()
+
+    failure_counts, total_primes_tested = run_cfr_suite(primes_arr)
 
     print(f"Progress: {total_primes_tested:,} / {total_primes_tested:,}   ")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    print_cfr_report(failure_counts, total_primes_tested)
+
+def print_cfr_report(failure_counts, total_primes_tested):
+    """Prints the PAC-1 report for the results of run_cfr_suite()."""
     # --- Final Reports ---
     print("\n" + "="*20 + " PAC-1: COMPOSITE FAILURE RATE (CFR) REPORT " + "="*20)
     print(f"Total Primes Analyzed (q > 7): {total_primes_tested:,}")
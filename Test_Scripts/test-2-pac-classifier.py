@@ -14,14 +14,19 @@
 # that is divisible by any of the prime factors of P_k.
 #
 # CORRECTION:
-#   a complete 'prime_set'. This is necessary for the
-#   'q_prime in prime_set' check to be logically valid when
+#   a complete prime array. This is necessary for the nearest
+#   'q_prime' lookup to be logically valid when
 #   S_n becomes larger than p_{50,000,000}.
 # ==============================================================================
 
-import math
 import time
-from collections import defaultdict
+
+import numpy as np
+
+from pac_common import (
+    FAILURE_EVENT_DTYPE, SEARCH_LIMIT, cached_anchor_sums, cached_primes, check_search_coverage, failure_events,
+    scan_law_I_failures
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt" 
@@ -32,135 +37,120 @@ START_INDEX = 10
 def load_primes_from_file(filename):
     """
     Loads ALL primes from the text file.
-    This is critical for the 'in prime_set' check to work
+    This is critical for the nearest-prime lookup to work
     for large S_n anchors.
     """
     print(f"Loading ALL primes from {filename}...")
     print("(This may take a moment and consume significant RAM)")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        primes_arr = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    # We create the set from the *entire* list of primes
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
     
     # Now, check if we have enough primes for the requested test
     required_primes = MAX_PRIME_PAIRS_TO_TEST + START_INDEX + 10
-    if len(prime_list) < required_primes:
+    if len(primes_arr) < required_primes:
         print(f"\nFATAL ERROR: Prime file is too small.")
-        print(f"  Need {required_primes:,} primes, but file only has {len(prime_list):,}.")
-        return None, None
+        print(f"  Need {required_primes:,} primes, but file only has {len(primes_arr):,}.")
+        return None
         
-    return prime_list, prime_set
+    return primes_arr
+
+# --- Divisibility table for the classifier ---
+# K_FACTORS[k] packs (k % 3 == 0) | (k % 5 == 0) << 1 | (k % 7 == 0) << 2.
+# k_min never exceeds the search limit, so this table covers every lookup.
+DIV_3, DIV_5, DIV_7 = 1, 2, 4
+K_FACTORS = np.zeros(SEARCH_LIMIT + 1, dtype=np.uint8)
+K_FACTORS[::3] |= DIV_3
+K_FACTORS[::5] |= DIV_5
+K_FACTORS[::7] |= DIV_7
+
+def count_k_values(k_values):
+    """Returns the histogram counts[k] of an array of k values (0 <= k <= SEARCH_LIMIT)."""
+    return np.bincount(k_values, minlength=SEARCH_LIMIT + 1)
+
+def run_classifier_suite(n_index, anchors, q_primes, k_values):
+    """
+    Runs the P_2, P_3 and P_4 classifiers over the Law I failures given as
+    (n_index, S_n, q_prime, k) arrays. Returns the per-filter results.
+    """
+    # --- 3. Run the Classifier Suite ---
+    k_factors = K_FACTORS[k_values]
+    # 6 and 30 both divide 210, so one residue serves all three filters
+    anchor_mod_210 = anchors % 210
+
+    # --- P2 (Mod 6) Test ---
+    perfect_p2 = (anchor_mod_210 % 6 == 0)
+    p2_failures_by_k = count_k_values(k_values[perfect_p2]) # k values from S_n % 6 == 0
+    # S_n % 6 == 0 but k % 3 == 0
+    violations_p2 = failure_events(perfect_p2 & (k_factors & DIV_3 != 0), n_index, anchors, q_primes, k_values)
+
+    # --- P3 (Mod 30) Test ---
+    perfect_p3 = (anchor_mod_210 % 30 == 0)
+    p3_failures_by_k = count_k_values(k_values[perfect_p3]) # k values from S_n % 30 == 0
+    # S_n % 30 == 0 but (k % 3 == 0 or k % 5 == 0)
+    violations_p3 = failure_events(perfect_p3 & (k_factors & (DIV_3 | DIV_5) != 0), n_index, anchors, q_primes, k_values)
+
+    # --- P4 (Mod 210) Test ---
+    perfect_p4 = (anchor_mod_210 == 0)
+    p4_failures_by_k = count_k_values(k_values[perfect_p4]) # k values from S_n % 210 == 0
+    # S_n % 210 == 0 but (k % 3 == 0, k % 5 == 0, or k % 7 == 0)
+    violations_p4 = failure_events(perfect_p4 & (k_factors != 0), n_index, anchors, q_primes, k_values)
+
+    return {
+        "total_law_I_failures": len(k_values),
+        "p2_failures_by_k": p2_failures_by_k,
+        "p3_failures_by_k": p3_failures_by_k,
+        "p4_failures_by_k": p4_failures_by_k,
+        "violations_p2": violations_p2,
+        "violations_p3": violations_p3,
+        "violations_p4": violations_p4
+    }
 
 # --- Main Testing Logic ---
 def run_PAC_classifier_suite():
     
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE)
-    if prime_list is None: return
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
 
     print(f"\nStarting PAC Classifier Suite for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
-    print(f"  - Testing S_n anchors from p_n={prime_list[START_INDEX]}...")
+    print(f"  - Testing S_n anchors from p_n={primes_arr[START_INDEX]}...")
     print(f"  - Hunting for violations of the Primorial Filter hypothesis.")
     print("-" * 80)
     start_time = time.time()
     
-    total_law_I_failures = 0
-    
-    violations_p2 = [] # S_n % 6 == 0 but k % 3 == 0
-    violations_p3 = [] # S_n % 30 == 0 but (k % 3 == 0 or k % 5 == 0)
-    violations_p4 = [] # S_n % 210 == 0 but (k % 3 == 0, k % 5 == 0, or k % 7 == 0)
 
-    p2_failures_by_k = defaultdict(int) # k values from S_n % 6 == 0
-    p3_failures_by_k = defaultdict(int) # k values from S_n % 30 == 0
-    p4_failures_by_k = defaultdict(int) # k values from S_n % 210 == 0
-    
-    # Main loop
+    # Main range
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + START_INDEX
-    
-    for i in range(START_INDEX, loop_end_index):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - START_INDEX + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Violations: {len(violations_p4)} | Time: {elapsed:.0f}s", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
-
-        # --- 1. Find the Law I Failure ---
-        min_distance_k = 0
-        q_prime = 0
-        search_dist = 1
-        
-        while True:
-            q_lower = anchor_S_n - search_dist
-            q_upper = anchor_S_n + search_dist
-
-            # We must check 'q_lower' first, as it's the
-            # canonical "closest" prime in a tie.
-            if q_lower in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_lower
-                break
-            if q_upper in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_upper
-                break
-                
-            search_dist += 1
-            if search_dist > 2000: break 
-        
-        if min_distance_k == 0: continue 
+    if not check_search_coverage(primes_arr, cached_anchor_sums(PRIME_INPUT_FILE), START_INDEX, loop_end_index):
+        return # Stop execution if primes are insufficient
+    # Anchors with no prime within the search limit are skipped silently
+    (n_index, anchors, q_primes, k_values), _ = scan_law_I_failures(PRIME_INPUT_FILE, START_INDEX, loop_end_index)
+    total_law_I_failures = len(k_values)
 
-        # --- 2. Check if it's a composite failure ---
-        # NOTE: k > 1 is implicit since search_dist starts at 1
-        # and we only get here if k is not in prime_set.
-        is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-        
-        if is_k_composite:
-            total_law_I_failures += 1
-            
-            failure_event = {
-                "n_index": i, 
-                "S_n": anchor_S_n, 
-                "q_prime": q_prime, 
-                "k_composite": min_distance_k
-            }
-            
-            # --- 3. Run the Classifier Suite ---
-            k_mod_3 = (min_distance_k % 3 == 0)
-            k_mod_5 = (min_distance_k % 5 == 0)
-            k_mod_7 = (min_distance_k % 7 == 0)
-
-            # --- P2 (Mod 6) Test ---
-            if anchor_S_n % 6 == 0:
-                p2_failures_by_k[min_distance_k] += 1
-                if k_mod_3:
-                    violations_p2.append(failure_event)
-
-            # --- P3 (Mod 30) Test ---
-            if anchor_S_n % 30 == 0:
-                p3_failures_by_k[min_distance_k] += 1
-                if k_mod_3 or k_mod_5:
-                    violations_p3.append(failure_event)
-
-            # --- P4 (Mod 210) Test ---
-            if anchor_S_n % 210 == 0:
-                p4_failures_by_k[min_distance_k] += 1
-                if k_mod_3 or k_mod_5 or k_mod_7:
-                    violations_p4.append(failure_event)
-
-    print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Violations: {len(violations_p4)} | Time: {time.time() - start_time:.0f}s")
+    suite = run_classifier_suite(n_index, anchors, q_primes, k_values)
+
+    print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Violations: {len(suite['violations_p4'])} | Time: {time.time() - start_time:.0f}s")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    print_classifier_report(suite)
+
+def print_classifier_report(suite):
+    """Prints the PAC-2 report for the results of run_classifier_suite()."""
+    total_law_I_failures = suite["total_law_I_failures"]
+    p2_failures_by_k = suite["p2_failures_by_k"]
+    p3_failures_by_k = suite["p3_failures_by_k"]
+    p4_failures_by_k = suite["p4_failures_by_k"]
+    violations_p2 = suite["violations_p2"]
+    violations_p3 = suite["violations_p3"]
+    violations_p4 = suite["violations_p4"]
+
     # --- Final Reports ---
     print("\n" + "="*20 + " PAC-2: CLASSIFIER SUITE REPORT " + "="*20)
     print(f"\nTotal S_n Anchors Analyzed: {MAX_PRIME_PAIRS_TO_TEST:,}")
@@ -168,26 +158,26 @@ def run_PAC_classifier_suite():
 
     # --- P2 (Mod 6) Report ---
     print("\n" + "-"*20 + " P_2 (Mod 6) Filter Analysis " + "-"*20)
-    print(f"  Total failures from 'perfect' (S_n % 6 == 0) anchors: {sum(p2_failures_by_k.values()):,}")
-    print(f"  Unique k-values seen: {sorted(p2_failures_by_k.keys())[:10]}...")
+    print(f"  Total failures from 'perfect' (S_n % 6 == 0) anchors: {int(p2_failures_by_k.sum()):,}")
+    print(f"  Unique k-values seen: {np.flatnonzero(p2_failures_by_k)[:10].tolist()}...")
     print(f"  >>> VIOLATIONS (k % 3 == 0): {len(violations_p2)}")
 
     # --- P3 (Mod 30) Report ---
     print("\n" + "-"*20 + " P_3 (Mod 30) Filter Analysis " + "-"*20)
-    print(f"  Total failures from 'perfect' (S_n % 30 == 0) anchors: {sum(p3_failures_by_k.values()):,}")
-    print(f"  Unique k-values seen: {sorted(p3_failures_by_k.keys())[:10]}...")
+    print(f"  Total failures from 'perfect' (S_n % 30 == 0) anchors: {int(p3_failures_by_k.sum()):,}")
+    print(f"  Unique k-values seen: {np.flatnonzero(p3_failures_by_k)[:10].tolist()}...")
     print(f"  >>> VIOLATIONS (k % 3 == 0 or k % 5 == 0): {len(violations_p3)}")
     
     # --- P4 (Mod 210) Report ---
     print("\n" + "-"*20 + " P_4 (Mod 210) Filter Analysis " + "-"*20)
-    print(f"  Total failures from 'perfect' (S_n % 210 == 0) anchors: {sum(p4_failures_by_k.values()):,}")
-    print(f"  Unique k-values seen: {sorted(p4_failures_by_k.keys())[:10]}...")
+    print(f"  Total failures from 'perfect' (S_n % 210 == 0) anchors: {int(p4_failures_by_k.sum()):,}")
+    print(f"  Unique k-values seen: {np.flatnonzero(p4_failures_by_k)[:10].tolist()}...")
     print(f"  >>> VIOLATIONS (k % 3, 5, or 7 == 0): {len(violations_p4)}")
 
     # --- Final Conclusion ---
     print("\n\n" + "="*20 + " FINAL CONCLUSION " + "="*20)
     
-    if violations_p2 or violations_p3 or violations_p4:
+    if len(violations_p2) or len(violations_p3) or len(violations_p4):
         print("\n  [VERDICT: CONJECTURE FALSIFIED]")
         print("  The Primorial Anchor Conjecture has been Falsified.")
         print("  We found 'perfect' anchors that produced 'forbidden' k-values.")
@@ -196,8 +186,9 @@ def run_PAC_classifier_suite():
         print(f"  - P_3 (Mod 30) Violations: {len(violations_p3)}")
         print(f"  - P_4 (Mod 210) Violations: {len(violations_p4)}")
         
-        if violations_p4:
-             print(f"\n  First P_4 Violation Details: {violations_p4[0]}")
+        if len(violations_p4):
+             first_violation = dict(zip(FAILURE_EVENT_DTYPE.names, violations_p4[0].tolist()))
+             print(f"\n  First P_4 Violation Details: {first_violation}")
     else:
         print("\n  [VERDICT: CONJECTURE VERIFIED]")
         print("  The hypothesis is confirmed with 100% accuracy across the test range.")
@@ -11,9 +11,14 @@
 #    they produce.
 # ==============================================================================
 
-import math
 import time
-from collections import defaultdict
+
+import numpy as np
+
+from pac_common import (
+    SEARCH_LIMIT, cached_anchor_sums, cached_primes, check_search_coverage, first_seen, most_frequent_first,
+    scan_law_I_failures
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
@@ -26,91 +31,66 @@ def load_primes_from_file(filename):
     print(f"Loading ALL primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        primes_arr = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
     
     required_primes = MAX_PRIME_PAIRS_TO_TEST + START_INDEX + 10
-    if len(prime_list) < required_primes:
+    if len(primes_arr) < required_primes:
         print(f"\nFATAL ERROR: Prime file is too small.")
-        return None, None
+        return None
         
-    return prime_list, prime_set
+    return primes_arr
+
+def classify_by_residue(anchors, k_values):
+    """
+    Groups the Law I failures given as (S_n, k) arrays by S_n % 30.
+    Returns (counts, first): two (30, SEARCH_LIMIT + 1) arrays where row r
+    counts the composite k values of the anchors with S_n % 30 == r, and
+    holds the position of the first failure of each (r, k) bin.
+    """
+    # --- 3. Classify by Residue (Mod 30) ---
+    # Flatten (residue, k) into one bin index so a single bincount fills every row
+    residues_mod_30 = anchors % 30
+    bins = residues_mod_30 * (SEARCH_LIMIT + 1) + k_values
+    counts = np.bincount(bins, minlength=30 * (SEARCH_LIMIT + 1))
+    first = first_seen(bins, 30 * (SEARCH_LIMIT + 1))
+    return counts.reshape(30, SEARCH_LIMIT + 1), first.reshape(30, SEARCH_LIMIT + 1)
 
 # --- Main Testing Logic ---
 def run_PAC_residue_analysis_mod30():
     
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE)
-    if prime_list is None: return
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
 
     print(f"\nStarting PAC Residue Class Analysis (Mod 30) for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
     print(f"  - Analyzing distribution of k failures for each S_n % 30 residue class.")
     print("-" * 80)
     start_time = time.time()
     
-    # --- Data structures for the test ---
-    total_law_I_failures = 0
-    
-    # Dictionary to hold failure data: {residue: {k_composite: count}}
-    failures_by_residue = {i: defaultdict(int) for i in range(30)}
-    
+
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + START_INDEX
-    
-    for i in range(START_INDEX, loop_end_index):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - START_INDEX + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Time: {elapsed:.0f}s", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
-
-        # --- 1. Find the Law I Failure ---
-        min_distance_k = 0
-        q_prime = 0
-        search_dist = 1
-        
-        while True:
-            q_lower = anchor_S_n - search_dist
-            q_upper = anchor_S_n + search_dist
-
-            if q_lower in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_lower
-                break
-            if q_upper in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_upper
-                break
-                
-            search_dist += 1
-            if search_dist > 2000: break 
-        
-        if min_distance_k == 0: continue 
+    if not check_search_coverage(primes_arr, cached_anchor_sums(PRIME_INPUT_FILE), START_INDEX, loop_end_index):
+        return # Stop execution if primes are insufficient
+    # Anchors with no prime within the search limit are skipped silently
+    (_, anchors, _, k_values), _ = scan_law_I_failures(PRIME_INPUT_FILE, START_INDEX, loop_end_index)
+    total_law_I_failures = len(k_values)
+
+    # Histogram of failure data: failures_by_residue[residue, k_composite]
+    failures_by_residue, first_seen_by_residue = classify_by_residue(anchors, k_values)
 
-        # --- 2. Check if it's a composite failure ---
-        is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-        
-        if is_k_composite:
-            total_law_I_failures += 1
-            
-            # --- 3. Classify by Residue (Mod 30) ---
-            residue_mod_30 = anchor_S_n % 30
-            
-            # Record the specific composite k for this residue
-            failures_by_residue[residue_mod_30][min_distance_k] += 1
-            
     print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Time: {time.time() - start_time:.0f}s")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    print_residue_report(total_law_I_failures, failures_by_residue, first_seen_by_residue)
+
+def print_residue_report(total_law_I_failures, failures_by_residue, first_seen_by_residue):
+    """Prints the PAC-3 report for the results of classify_by_residue()."""
     # --- Final Reports ---
     print("\n" + "="*20 + " PAC-3: RESIDUE CLASS ANALYSIS (MOD 30) REPORT " + "="*20)
     print(f"\nTotal S_n Anchors Analyzed: {MAX_PRIME_PAIRS_TO_TEST:,}")
@@ -135,19 +115,20 @@ def run_PAC_residue_analysis_mod30():
 
     for residue in range(30):
         failure_data = failures_by_residue[residue]
-        total_failures_in_class = sum(failure_data.values())
+        total_failures_in_class = int(failure_data.sum())
+        observed_k = np.flatnonzero(failure_data)
         
         print("\n" + "-" * 20 + f" S_n % 30 == {residue} " + "-" * 20)
         print(f"  Total Failures in this Class: {total_failures_in_class:,}")
         
-        if not failure_data:
+        if not total_failures_in_class:
             if residue not in possible_S_n_residues and residue != 0: # Check if residue is expected
                  print("  (This residue class is not expected for S_n where n > 3)")
             continue
 
         # Check PAC prediction for residue 0
         if residue == 0:
-            forbidden_k_found = {k for k in failure_data if k % 3 == 0 or k % 5 == 0}
+            forbidden_k_found = {k for k in observed_k.tolist() if k % 3 == 0 or k % 5 == 0}
             if not forbidden_k_found:
                 print("  [PAC VERIFIED] No k divisible by 3 or 5 found.")
             else:
@@ -155,7 +136,8 @@ def run_PAC_residue_analysis_mod30():
 
         # Show top 5 most frequent k values for this class
         print("  Top 5 Composite k Values:")
-        sorted_k = sorted(failure_data.items(), key=lambda item: item[1], reverse=True)
+        ranked_k = most_frequent_first(failure_data, first_seen_by_residue[residue])
+        sorted_k = [(int(k), int(failure_data[k])) for k in ranked_k]
         for k, count in sorted_k[:5]:
              percentage = (count / total_failures_in_class) * 100 if total_failures_in_class else 0
              print(f"    - k = {k:<5}: {count:<10,} ({percentage:.2f}%)")
@@ -16,13 +16,30 @@
 
 import math
 import time
-from collections import defaultdict
+import numpy as np
+
+from pac_common import (
+    BLOCK_SIZE, FAILURE_EVENT_DTYPE, SEARCH_LIMIT, cached_anchor_sums, cached_primes, check_search_coverage,
+    failure_events, imap_blocks, load_prime_arrays, nearest_prime_distance, odd_prime_bits, prime_bit, primes_through
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
 MAX_PRIME_PAIRS_TO_TEST = 50000000
 # Start index safe past p_5 = 11. n=10 (p_10=31) is still fine.
 START_INDEX = 10
+# Increased safety break for the rarer perfect anchors (others use SEARCH_LIMIT)
+PERFECT_SEARCH_LIMIT = 3000
+
+# --- Divisibility table for the violation check ---
+# K_FACTORS[k] packs (k % 3 == 0) | (k % 5 == 0) << 1 | (k % 7 == 0) << 2 | (k % 11 == 0) << 3.
+# Perfect-anchor k never exceeds PERFECT_SEARCH_LIMIT, so this table covers every lookup.
+DIV_3, DIV_5, DIV_7, DIV_11 = 1, 2, 4, 8
+K_FACTORS = np.zeros(PERFECT_SEARCH_LIMIT + 1, dtype=np.uint8)
+K_FACTORS[::3] |= DIV_3
+K_FACTORS[::5] |= DIV_5
+K_FACTORS[::7] |= DIV_7
+K_FACTORS[::11] |= DIV_11
 
 # --- Function to load primes from a file ---
 def load_primes_from_file(filename):
@@ -30,28 +47,73 @@ def load_primes_from_file(filename):
     print(f"Loading ALL primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        primes_arr = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
     
     required_primes = MAX_PRIME_PAIRS_TO_TEST + START_INDEX + 10
-    if len(prime_list) < required_primes:
+    if len(primes_arr) < required_primes:
         print(f"\nFATAL ERROR: Prime file is too small.")
-        return None, None
+        return None
         
-    return prime_list, prime_set
+    return primes_arr
+
+# --- Anchor kernel for a block of indices ---
+def scan_anchor_block(primes_arr, anchors_arr, prime_bits, start, stop):
+    """
+    Runs the P_5 search over the anchors S_i for start <= i < stop.
+    Returns (law_I_failures, perfect_anchors, perfect_failures, skipped),
+    where perfect_failures holds the (n_index, S_n, q_prime, k) arrays of
+    the composite k failures from S_n % 2310 == 0 anchors, and skipped the
+    indices of the perfect anchors beyond PERFECT_SEARCH_LIMIT.
+    """
+    # --- Find the Law I k_min for every anchor of the block ---
+    anchors = anchors_arr[start:stop]
+    min_distance_k, lower_first = nearest_prime_distance(primes_arr, anchors)
+
+    # --- Check which anchors are perfect mod 2310 ---
+    is_perfect_anchor = (anchors % 2310 == 0)
+    perfect_anchors = int(np.count_nonzero(is_perfect_anchor))
+
+    # Increase safety break slightly for rarer anchors. Skipped perfect
+    # anchors are reported by the driver (workers never print).
+    over_limit = min_distance_k > np.where(is_perfect_anchor, PERFECT_SEARCH_LIMIT, SEARCH_LIMIT)
+    skipped = np.flatnonzero(over_limit & is_perfect_anchor) + start
+    min_distance_k[over_limit] = 0
+
+    # --- Count overall failures for context ---
+    # Skipped anchors have k_min == 0, so prime_bits only needs k <= PERFECT_SEARCH_LIMIT
+    is_k_composite = (min_distance_k > 1) & (prime_bit(prime_bits, min_distance_k) == 0)
+    law_I_failures = int(np.count_nonzero(is_k_composite))
+
+    # --- Only the perfect failures get the detail pass ---
+    perfect_idx = np.flatnonzero(is_perfect_anchor & is_k_composite)
+    perfect = anchors[perfect_idx]
+    k_values = min_distance_k[perfect_idx]
+    q_primes = np.where(lower_first[perfect_idx], perfect - k_values, perfect + k_values)
+    perfect_failures = (perfect_idx + start, perfect, q_primes, k_values)
+
+    return law_I_failures, perfect_anchors, perfect_failures, skipped
+
+# --- Per-worker arrays of the block kernel ---
+# The only primality lookups left are on k_min, so each worker packs the
+# bits of the primes up to PERFECT_SEARCH_LIMIT instead of the whole file.
+def load_worker_arrays(primes_path, primes_count, anchors_count):
+    """Returns the (primes, anchors, prime_bits) arguments of scan_anchor_block()."""
+    primes_arr, anchors_arr = load_prime_arrays(primes_path, primes_count, anchors_count)
+    prime_bits = odd_prime_bits(primes_arr[:primes_through(primes_arr, PERFECT_SEARCH_LIMIT)])
+    return primes_arr, anchors_arr, prime_bits
 
 # --- Main Testing Logic ---
 def run_PAC_mod2310_verification():
     
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE)
-    if prime_list is None: return
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
+    anchors_arr = cached_anchor_sums(PRIME_INPUT_FILE)
 
     print(f"\nStarting PAC Mod 2310 Verification for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
     print(f"  - Hunting for violations for S_n % 2310 == 0 anchors.")
@@ -61,109 +123,60 @@ def run_PAC_mod2310_verification():
     # --- Data structures for the test ---
     total_law_I_failures = 0
     perfect_mod2310_anchors_found = 0
-    failures_from_perfect_mod2310 = defaultdict(int) # Store {k_composite: count}
-    violations_p5 = [] # Store violation events
+    perfect_k_values = [] # Per-block arrays of the composite k from perfect anchors
+    block_violations = [] # Per-block FAILURE_EVENT_DTYPE arrays of violation events
+    total_violations = 0
 
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + START_INDEX
-    
-    for i in range(START_INDEX, loop_end_index):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - START_INDEX + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Perfect Anchors: {perfect_mod2310_anchors_found:,} | Violations: {len(violations_p5)}", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
-
-        # --- Check if anchor is perfect mod 2310 FIRST ---
-        is_perfect_anchor = (anchor_S_n % 2310 == 0)
-        if is_perfect_anchor:
-            perfect_mod2310_anchors_found += 1
-
-            # --- Find the Law I k_min for this anchor ---
-            min_distance_k = 0
-            q_prime = 0
-            search_dist = 1
-            
-            while True:
-                q_lower = anchor_S_n - search_dist
-                q_upper = anchor_S_n + search_dist
-
-                if q_lower in prime_set:
-                    min_distance_k = search_dist
-                    q_prime = q_lower
-                    break
-                if q_upper in prime_set:
-                    min_distance_k = search_dist
-                    q_prime = q_upper
-                    break
-                    
-                search_dist += 1
-                # Increase safety break slightly for rarer anchors
-                if search_dist > 3000: break 
-            
-            if min_distance_k == 0: 
-                print(f"\nWarning: Search limit exceeded for perfect anchor S_n={anchor_S_n:,} at index {i}. Skipping.")
-                continue 
-
-            # --- Check if it's a composite failure ---
-            is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-            
-            if is_k_composite:
-                total_law_I_failures += 1 # Count overall failures for context
-                failures_from_perfect_mod2310[min_distance_k] += 1
-                
-                failure_event = {
-                    "n_index": i, 
-                    "S_n": anchor_S_n, 
-                    "q_prime": q_prime, 
-                    "k_composite": min_distance_k
-                }
-                
-                # --- Check for VIOLATION ---
-                # Check divisibility by 3, 5, 7, 11 (prime factors of 2310, excluding 2)
-                if (min_distance_k % 3 == 0 or 
-                    min_distance_k % 5 == 0 or 
-                    min_distance_k % 7 == 0 or 
-                    min_distance_k % 11 == 0):
-                    violations_p5.append(failure_event)
-        else:
-            # If not a perfect anchor, still find k_min to count total failures
-            min_distance_k = 0
-            search_dist = 1
-            while True:
-                q_lower = anchor_S_n - search_dist
-                q_upper = anchor_S_n + search_dist
-                if q_lower in prime_set or q_upper in prime_set:
-                    min_distance_k = search_dist
-                    break
-                search_dist += 1
-                if search_dist > 2000: break
-            
-            if min_distance_k > 0:
-                 is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-                 if is_k_composite:
-                      total_law_I_failures += 1
-
-
+    if not check_search_coverage(primes_arr, anchors_arr, START_INDEX, loop_end_index, PERFECT_SEARCH_LIMIT):
+        return # Stop execution if primes are insufficient
+
+    # Workers only see the primes up to the last anchor's search window
+    upper = int(anchors_arr[loop_end_index - 1]) + PERFECT_SEARCH_LIMIT
+    primes_count = primes_through(primes_arr, upper)
+
+    def print_progress(block_stop):
+        progress = block_stop - START_INDEX
+        print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Perfect Anchors: {perfect_mod2310_anchors_found:,} | Violations: {total_violations}", end='\r')
+
+    # Blocks come back in order, so the report matches a serial run
+    blocks = imap_blocks(scan_anchor_block, load_worker_arrays, (PRIME_INPUT_FILE, primes_count, loop_end_index),
+                         START_INDEX, loop_end_index, BLOCK_SIZE, print_progress)
+    for _, block_result in blocks:
+        law_I_failures, perfect_anchors, perfect_failures, skipped = block_result
+        for i in skipped.tolist():
+            print(f"\nWarning: Search limit exceeded for perfect anchor S_n={int(anchors_arr[i]):,} at index {i}. Skipping.")
+        total_law_I_failures += law_I_failures
+        perfect_mod2310_anchors_found += perfect_anchors
+        perfect_k_values.append(perfect_failures[3])
+
+        # --- Check for VIOLATION ---
+        # Check divisibility by 3, 5, 7, 11 (prime factors of 2310, excluding 2)
+        violations = failure_events(K_FACTORS[perfect_failures[3]] != 0, *perfect_failures)
+        block_violations.append(violations)
+        total_violations += len(violations)
+
+    violations_p5 = np.concatenate(block_violations)
     print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Perfect Anchors: {perfect_mod2310_anchors_found:,} | Violations: {len(violations_p5)}   ")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    # Histogram of the perfect-anchor failures: failures_from_perfect_mod2310[k_composite]
+    failures_from_perfect_mod2310 = np.bincount(np.concatenate(perfect_k_values), minlength=PERFECT_SEARCH_LIMIT + 1)
+
     # --- Final Reports ---
     print("\n" + "="*20 + " PAC-4: MOD 2310 (P_5) VERIFICATION REPORT " + "="*20)
     print(f"\nTotal S_n Anchors Analyzed: {MAX_PRIME_PAIRS_TO_TEST:,}")
     print(f"Total Law I Failures (Overall): {total_law_I_failures:,}")
     print(f"Total 'Perfect' (S_n % 2310 == 0) Anchors Found: {perfect_mod2310_anchors_found:,}")
     
-    total_failures_from_perfect = sum(failures_from_perfect_mod2310.values())
+    total_failures_from_perfect = int(failures_from_perfect_mod2310.sum())
     print(f"\nTotal Composite k Failures from Perfect Anchors: {total_failures_from_perfect:,}")
     
-    if failures_from_perfect_mod2310:
+    if total_failures_from_perfect:
         print("  Composite k values observed:")
-        for k, count in sorted(failures_from_perfect_mod2310.items()):
-            print(f"    - k = {k}: {count:,} instance(s)")
+        for k in np.flatnonzero(failures_from_perfect_mod2310).tolist():
+            print(f"    - k = {k}: {int(failures_from_perfect_mod2310[k]):,} instance(s)")
     else:
         print("  No composite k failures were observed from perfect anchors.")
 
@@ -173,11 +186,12 @@ def run_PAC_mod2310_verification():
     # --- Final Conclusion ---
     print("\n\n" + "="*20 + " FINAL CONCLUSION " + "="*20)
     
-    if violations_p5:
+    if len(violations_p5):
         print("\n  [VERDICT: CONJECTURE FALSIFIED for P_5]")
         print("  The Primorial Anchor Conjecture failed for P_5 = 2310.")
         print("  We found 'perfect' anchors that produced 'forbidden' k-values.")
-        print(f"\n  First P_5 Violation Details: {violations_p5[0]}")
+        first_violation = dict(zip(FAILURE_EVENT_DTYPE.names, violations_p5[0].tolist()))
+        print(f"\n  First P_5 Violation Details: {first_violation}")
     else:
         print("\n  [VERDICT: CONJECTURE VERIFIED for P_5]")
         print("  The hypothesis is confirmed with 100% accuracy for P_5 across the test range.")
@@ -7,20 +7,25 @@
 # Requires the 'pandas' library: pip install pandas
 # ==============================================================================
 
+import numpy as np
 import pandas as pd
 from collections import Counter
 import time
 
+from pac_common import SIGNATURE_SHIFTS
+
 # --- Configuration ---
 INPUT_CSV_FILE = "pac_law3_correlation_data.csv"
+# The only CSV columns the analysis reads, with their compact dtypes
+CSV_DTYPES = {'fix_radius_r': np.int16, 'signature': np.int64}
 
 # --- Main Analysis Logic ---
 def analyze_correlation_data():
     print(f"Loading correlation data from {INPUT_CSV_FILE}...")
     start_time = time.time()
     try:
-        # Load the entire CSV into a pandas DataFrame
-        df = pd.read_csv(INPUT_CSV_FILE)
+        # Load only the analysed columns of the CSV into a pandas DataFrame
+        df = pd.read_csv(INPUT_CSV_FILE, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES)
     except FileNotFoundError:
         print(f"FATAL ERROR: The file '{INPUT_CSV_FILE}' was not found.")
         print("Please run the 'run_PAC_Law3_correlation_test()' script first.")
@@ -29,6 +34,11 @@ def analyze_correlation_data():
         print(f"FATAL ERROR: Could not load or parse the CSV file: {e}")
         return
 
+    # Unpack the primorial signatures of S_n and S_fix into their own columns
+    signature = df['signature'].to_numpy()
+    for column, shift in SIGNATURE_SHIFTS.items():
+        df[column] = ((signature >> shift) & 0xFF).astype(np.uint8)
+
     load_time = time.time() - start_time
     print(f"Loaded {len(df):,} failure records in {load_time:.2f} seconds.")
     print("-" * 80)
@@ -63,10 +73,10 @@ def analyze_correlation_data():
     # --- Analysis 2: Average 'r' by S_n Modulo Signature ---
     # We focus on Mod 30 as it showed distinct patterns in Test 3
     print("\n--- Average Fixing Radius (r) by S_n % 30 Residue Class ---")
-    # Calculate the mean 'r' for each Sn_mod30 group
-    avg_r_by_sn_mod30 = df.groupby('Sn_mod30')['fix_radius_r'].mean().sort_index()
-    # Calculate the count of failures for each Sn_mod30 group
-    count_by_sn_mod30 = df['Sn_mod30'].value_counts().sort_index()
+    # Calculate the mean 'r' and the count of failures for each Sn_mod30 group in one pass
+    r_by_sn_mod30 = df.groupby('Sn_mod30')['fix_radius_r'].agg(['mean', 'size'])
+    avg_r_by_sn_mod30 = r_by_sn_mod30['mean']
+    count_by_sn_mod30 = r_by_sn_mod30['size']
 
     print(f"{'S_n % 30':<10} | {'Failure Count':<15} | {'Average Fix Radius (r)':<25}")
     print("-" * 55)
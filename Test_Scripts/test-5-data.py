@@ -24,7 +24,13 @@
 import math
 import time
 from collections import defaultdict
-import csv # For saving detailed results
+
+import numpy as np
+
+from pac_common import (
+    BLOCK_SIZE, SIGNATURE_SHIFTS, cached_anchor_sums, cached_primes, check_search_coverage, imap_blocks,
+    load_prime_arrays, nearest_prime_distance, odd_prime_bits, prime_bit, primes_through
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
@@ -32,7 +38,18 @@ MAX_PRIME_PAIRS_TO_TEST = 50000000
 START_INDEX = 10
 # Set a reasonable upper limit for the Law III search
 MAX_LAW_III_RADIUS = 30
+# Increased safety break for the Law I search (the shared kernel uses SEARCH_LIMIT)
+LAW_I_SEARCH_LIMIT = 3000
 OUTPUT_CSV_FILE = "pac_law3_correlation_data.csv"
+# Primes packed into each worker's k bitmap; rarer larger k are looked up
+# in the prime list itself
+SMALL_PRIME_LIMIT = 1 << 16
+
+# Columns of the correlation CSV, in the order the kernel records them
+CSV_FIELDNAMES = [
+    'n_index', 'Sn', 'q_prime', 'k_composite',
+    'fix_radius_r', 'S_fix', 'signature'
+]
 
 # --- Function to load primes from a file ---
 def load_primes_from_file(filename):
@@ -40,38 +57,107 @@ def load_primes_from_file(filename):
     print(f"Loading ALL primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        primes_arr = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
+    print(f"Loaded {len(primes_arr):,} primes in {end_time - start_time:.2f} seconds.")
     
     required_primes = MAX_PRIME_PAIRS_TO_TEST + START_INDEX + MAX_LAW_III_RADIUS + 2
-    if len(prime_list) < required_primes:
+    if len(primes_arr) < required_primes:
         print(f"\nFATAL ERROR: Prime file is too small for S_n+r lookups.")
-        return None, None
+        return None
         
-    return prime_list, prime_set
-
-def is_clean_k(k_val, prime_set):
-    """Helper function to check if k is 1 or a prime."""
-    if k_val == 1:
-        return True
-    # Basic check for small numbers
-    if k_val < 2:
-        return False
-    # Check against the prime set
-    return k_val in prime_set
+    return primes_arr
+
+# S_{n+r} offsets in the order Law III tries them: n-1, n+1, n-2, n+2, ...
+LAW_III_OFFSETS = np.arange(1, MAX_LAW_III_RADIUS + 1).repeat(2) * np.tile([-1, 1], MAX_LAW_III_RADIUS)
+
+# --- Anchor kernel for a block of indices ---
+def scan_anchor_block(primes_arr, anchors_arr, prime_bits, start, stop):
+    """
+    Runs the Law I / Law III search over the anchors S_i for start <= i < stop.
+    Returns (law_I_failures, events, law_III_failure): events is an int64
+    array with one CSV_FIELDNAMES row per fixed failure, and law_III_failure
+    is the (n_index, S_n, q_prime, k) of the first failure Law III could not
+    fix (the block stops there), or None.
+    """
+    law_III_failure = None
+
+    anchors = anchors_arr[start:stop]
+
+    # --- 1. Find the Law I Failures of the whole block ---
+    k_mins, lower_first = nearest_prime_distance(primes_arr, anchors)
+
+    # --- 2. Check which are composite failures ---
+    # Increased safety break: anchors with k_min > LAW_I_SEARCH_LIMIT are skipped
+    k_mins[k_mins > LAW_I_SEARCH_LIMIT] = 0
+    rows = np.flatnonzero((k_mins > 1) & (prime_bit(prime_bits, k_mins) == 0))
+    n_index = rows + start
+    anchors = anchors[rows]
+    k_values = k_mins[rows]
+    q_primes = np.where(lower_first[rows], anchors - k_values, anchors + k_values)
+
+    # --- 3. Simulate Law III Search for every failure at once ---
+    # Row j holds k = |S_{n+offset} - q| for each offset in search order,
+    # so the first clean column is the fix Law III would find first.
+    candidates = anchors_arr[n_index[:, None] + LAW_III_OFFSETS]
+    k_fix = candidates - q_primes[:, None]
+    np.abs(k_fix, out=k_fix)
+
+    # A fix needs k == 1 or k prime; k beyond the bitmap are searched for
+    # in the (sorted) prime list instead
+    in_range = k_fix <= SMALL_PRIME_LIMIT
+    clean = (k_fix == 1) | (prime_bit(prime_bits, np.where(in_range, k_fix, 0)) == 1)
+    large_k = k_fix[~in_range]
+    found = np.minimum(np.searchsorted(primes_arr, large_k), len(primes_arr) - 1)
+    clean[~in_range] = primes_arr[found] == large_k
+    fix_found = clean.any(axis=1)
+    first_fix = clean.argmax(axis=1)
+
+    # --- 4. Record Results ---
+    unfixed = np.flatnonzero(~fix_found)
+    if unfixed.size:
+        # Law III Failed! The test stops at the first unfixed failure.
+        j = int(unfixed[0])
+        law_III_failure = (int(n_index[j]), int(anchors[j]), int(q_primes[j]), int(k_values[j]))
+        law_I_failures = j + 1
+    else:
+        j = law_I_failures = len(rows)
+
+    n_index, anchors, q_primes, k_values = n_index[:j], anchors[:j], q_primes[:j], k_values[:j]
+    radii = np.abs(LAW_III_OFFSETS[first_fix[:j]])
+    S_fix = candidates[np.arange(j), first_fix[:j]]
+
+    # --- 5. Record S_n and S_fix Signatures for the whole block ---
+    signature = (
+        (anchors % 6) << SIGNATURE_SHIFTS['Sn_mod6']
+        | (anchors % 30) << SIGNATURE_SHIFTS['Sn_mod30']
+        | (anchors % 210) << SIGNATURE_SHIFTS['Sn_mod210']
+        | (S_fix % 6) << SIGNATURE_SHIFTS['Sfix_mod6']
+        | (S_fix % 30) << SIGNATURE_SHIFTS['Sfix_mod30']
+        | (S_fix % 210) << SIGNATURE_SHIFTS['Sfix_mod210']
+    )
+    events = np.column_stack([n_index, anchors, q_primes, k_values, radii, S_fix, signature])
+    return law_I_failures, events, law_III_failure
+
+# --- Per-worker arrays of the block kernel ---
+# Each worker packs only the bits of the primes up to SMALL_PRIME_LIMIT
+# (and the first one past it, so the bitmap spans the whole limit).
+def load_worker_arrays(primes_path, primes_count, anchors_count):
+    """Returns the (primes, anchors, prime_bits) arguments of scan_anchor_block()."""
+    primes_arr, anchors_arr = load_prime_arrays(primes_path, primes_count, anchors_count)
+    prime_bits = odd_prime_bits(primes_arr[:primes_through(primes_arr, SMALL_PRIME_LIMIT)])
+    return primes_arr, anchors_arr, prime_bits
 
 # --- Main Testing Logic ---
 def run_PAC_Law3_correlation_test():
     
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE)
-    if prime_list is None: return
+    primes_arr = load_primes_from_file(PRIME_INPUT_FILE)
+    if primes_arr is None: return
+    anchors_arr = cached_anchor_sums(PRIME_INPUT_FILE)
 
     print(f"\nStarting PAC-Law III Correlation Test for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
     print(f"  - Recording signatures of S_n, S_fix, and fixing radius r.")
@@ -84,20 +170,12 @@ def run_PAC_Law3_correlation_test():
     max_r_observed = 0
     law_III_failures = [] # Should remain empty if Law III holds
     
-    # List to store correlation data dictionaries
+    # Per-block int64 event arrays, written to the CSV in one call at the end
     correlation_data = []
 
     # Prepare CSV file
     try:
         csvfile = open(OUTPUT_CSV_FILE, 'w', newline='')
-        fieldnames = [
-            'n_index', 'Sn', 'q_prime', 'k_composite',
-            'Sn_mod6', 'Sn_mod30', 'Sn_mod210',
-            'fix_radius_r', 'S_fix',
-            'Sfix_mod6', 'Sfix_mod30', 'Sfix_mod210'
-        ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
     except IOError:
         print(f"FATAL ERROR: Could not open {OUTPUT_CSV_FILE} for writing.")
         return
@@ -106,105 +184,49 @@ def run_PAC_Law3_correlation_test():
     loop_start_index = START_INDEX + MAX_LAW_III_RADIUS # Need buffer for S_{n-r}
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + loop_start_index
     
-    if loop_end_index >= len(prime_list) - MAX_LAW_III_RADIUS -1 :
+    if loop_end_index >= len(primes_arr) - MAX_LAW_III_RADIUS -1 :
          print(f"\nFATAL ERROR: Not enough primes loaded for S_n+r lookups at the end.")
          csvfile.close()
          return
+    if not check_search_coverage(primes_arr, anchors_arr, loop_start_index, loop_end_index, LAW_I_SEARCH_LIMIT):
+        csvfile.close()
+        return
 
-    for i in range(loop_start_index, loop_end_index):
-        if (i - loop_start_index + 1) % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - loop_start_index + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Max r: {max_r_observed} | Time: {elapsed:.0f}s", end='\r')
+    r_column = CSV_FIELDNAMES.index('fix_radius_r')
 
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
+    # Workers only see the primes up to the last anchor's neighbours
+    anchors_count = loop_end_index + MAX_LAW_III_RADIUS
+    upper = int(anchors_arr[anchors_count - 1])
+    primes_count = primes_through(primes_arr, upper)
 
-        # --- 1. Find the Law I Failure ---
-        min_distance_k = 0
-        q_prime = 0
-        search_dist = 1
-        
-        while True:
-            q_lower = anchor_S_n - search_dist
-            q_upper = anchor_S_n + search_dist
-
-            if q_lower > 1 and q_lower in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_lower
-                break
-            if q_upper in prime_set:
-                min_distance_k = search_dist
-                q_prime = q_upper
-                break
-                
-            search_dist += 1
-            if search_dist > 3000: break # Increased safety break
-        
-        if min_distance_k == 0: continue 
+    def print_progress(block_stop):
+        elapsed = time.time() - start_time
+        progress = block_stop - loop_start_index
+        print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Max r: {max_r_observed} | Time: {elapsed:.0f}s", end='\r')
 
-        # --- 2. Check if it's a composite failure ---
-        is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-        
-        if is_k_composite:
-            total_law_I_failures += 1
-            
-            # --- 3. Record S_n Signatures ---
-            Sn_mod6 = anchor_S_n % 6
-            Sn_mod30 = anchor_S_n % 30
-            Sn_mod210 = anchor_S_n % 210
-            
-            # --- 4. Simulate Law III Search ---
-            fix_found = False
-            fixing_radius_r = 0
-            S_fix = 0
-            Sfix_mod6, Sfix_mod30, Sfix_mod210 = -1, -1, -1 # Default invalid values
-
-            for r in range(1, MAX_LAW_III_RADIUS + 1):
-                # Check S_{n-r}
-                S_prev = prime_list[i - r] + prime_list[i - r + 1]
-                k_prev = abs(S_prev - q_prime)
-                if is_clean_k(k_prev, prime_set):
-                    fix_found = True
-                    fixing_radius_r = r
-                    S_fix = S_prev
-                    break # Fix found
-
-                # Check S_{n+r}
-                S_next = prime_list[i + r] + prime_list[i + r + 1]
-                k_next = abs(S_next - q_prime)
-                if is_clean_k(k_next, prime_set):
-                    fix_found = True
-                    fixing_radius_r = r
-                    S_fix = S_next
-                    break # Fix found
-
-            # --- 5. Record Results ---
-            if fix_found:
-                if fixing_radius_r > max_r_observed:
-                    max_r_observed = fixing_radius_r
-                
-                Sfix_mod6 = S_fix % 6
-                Sfix_mod30 = S_fix % 30
-                Sfix_mod210 = S_fix % 210
-
-                event_data = {
-                    'n_index': i, 'Sn': anchor_S_n, 'q_prime': q_prime, 'k_composite': min_distance_k,
-                    'Sn_mod6': Sn_mod6, 'Sn_mod30': Sn_mod30, 'Sn_mod210': Sn_mod210,
-                    'fix_radius_r': fixing_radius_r, 'S_fix': S_fix,
-                    'Sfix_mod6': Sfix_mod6, 'Sfix_mod30': Sfix_mod30, 'Sfix_mod210': Sfix_mod210
-                }
-                correlation_data.append(event_data)
-                writer.writerow(event_data) # Write to CSV immediately
-
-            else:
-                # Law III Failed!
-                law_III_failures.append(i)
-                print(f"\nFATAL: Law III Falsified at index {i} (S_n={anchor_S_n:,}, q={q_prime:,}, k={min_distance_k:,}). Could not find fix within r={MAX_LAW_III_RADIUS}. Stopping.")
-                break # Stop the test immediately
-
-    # Close CSV file
+    # Blocks come back in order, so the first Law III failure reported is
+    # the first in index order
+    blocks = imap_blocks(scan_anchor_block, load_worker_arrays, (PRIME_INPUT_FILE, primes_count, anchors_count),
+                         loop_start_index, loop_end_index, BLOCK_SIZE, print_progress)
+    for _, block_result in blocks:
+        law_I_failures, events, law_III_failure = block_result
+        total_law_I_failures += law_I_failures
+        if len(events):
+            max_r_observed = max(max_r_observed, int(events[:, r_column].max()))
+
+        correlation_data.append(events)
+
+        if law_III_failure is not None:
+            # Law III Failed!
+            i, anchor_S_n, q_prime, min_distance_k = law_III_failure
+            law_III_failures.append(i)
+            print(f"\nFATAL: Law III Falsified at index {i} (S_n={anchor_S_n:,}, q={q_prime:,}, k={min_distance_k:,}). Could not find fix within r={MAX_LAW_III_RADIUS}. Stopping.")
+            break # Stop the test immediately
+    blocks.close() # Shuts the pool down now if the loop stopped early
+
+    # Write every event in one batch (same \r\n rows the csv module wrote)
+    np.savetxt(csvfile, np.concatenate(correlation_data), fmt='%d', delimiter=',',
+               newline='\r\n', header=','.join(CSV_FIELDNAMES), comments='')
     csvfile.close()
 
     # --- Final Summary ---
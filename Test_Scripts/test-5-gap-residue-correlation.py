@@ -15,11 +15,18 @@ import math
 import time
 from collections import defaultdict
 
+import numpy as np
+
+from pac_common import BLOCK_SIZE, cached_anchor_sums, cached_prime_gaps, cached_primes, imap_blocks
+
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
 MAX_PRIME_PAIRS_TO_TEST = 50000000
 # Start index safe past p_4 = 7. n=10 (p_10=31) is still fine.
 START_INDEX = 10
+# Primorial moduli P_2, P_3, P_4 of the residue classes. Each divides
+# P_4 = 210, so every class is folded out of the one mod-210 histogram.
+MODULI = (6, 30, 210)
 
 # --- Function to load primes from a file ---
 def load_primes_from_file(filename):
@@ -27,8 +34,7 @@ def load_primes_from_file(filename):
     print(f"Loading ALL primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        prime_list = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
         return None
@@ -45,11 +51,46 @@ def load_primes_from_file(filename):
         
     return prime_list
 
+# --- Residue kernel for a block of indices ---
+def scan_anchor_block(anchors_arr, gaps_arr, start, stop):
+    """
+    Histograms the anchors S_i for start <= i < stop by S_i % 210.
+    Returns (counts, gap_sums): the anchors and the sum of their gaps
+    g_i in each residue class.
+    """
+    anchors = anchors_arr[start:stop]
+    gaps = gaps_arr[start:stop]
+
+    # --- Calculate Residues and Accumulate Stats ---
+    # One pass over the block's anchors and gaps: the mod 6 and mod 30
+    # classes are folded out of these 210 bins afterwards
+    residues_mod_210 = (anchors % 210).astype(np.int16)
+    counts = np.bincount(residues_mod_210, minlength=210)
+    # Gap sums stay far below 2^53, so the float64 weights sum exactly
+    gap_sums = np.bincount(residues_mod_210, weights=gaps, minlength=210).astype(np.int64)
+    return counts, gap_sums
+
+def fold_residues(histogram_mod_210, modulus):
+    """
+    Folds a histogram over the residues mod 210 into one mod 'modulus'
+    (a divisor of 210): residue r lands in bin r % modulus.
+    """
+    return histogram_mod_210.reshape(-1, modulus).sum(axis=0)
+
+# --- Per-worker arrays of the block kernel ---
+# Workers send back only the small per-block histograms.
+def load_worker_arrays(primes_path, anchors_count):
+    """Returns the (anchors, gaps) arguments of scan_anchor_block()."""
+    return cached_anchor_sums(primes_path)[:anchors_count], cached_prime_gaps(primes_path)[:anchors_count]
+
 # --- Main Testing Logic ---
 def run_PAC_gap_residue_correlation():
     
     prime_list = load_primes_from_file(PRIME_INPUT_FILE)
     if prime_list is None: return
+    # Build (or map) the anchor and gap caches once, before the workers do
+    cached_anchor_sums(PRIME_INPUT_FILE)
+    cached_prime_gaps(PRIME_INPUT_FILE)
 
     print(f"\nStarting PAC Gap Size vs. Residue Correlation for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
     print(f"  - Calculating average gap g_n for each S_n % P_k class (k=2,3,4).")
@@ -57,48 +98,34 @@ def run_PAC_gap_residue_correlation():
     start_time = time.time()
     
     # --- Data structures for the test ---
-    # Store {residue: {'count': N, 'gap_sum': total_gap}}
-    gap_stats_mod6 = {i: {'count': 0, 'gap_sum': 0} for i in range(6)}
-    gap_stats_mod30 = {i: {'count': 0, 'gap_sum': 0} for i in range(30)}
-    gap_stats_mod210 = {i: {'count': 0, 'gap_sum': 0} for i in range(210)}
-    
-    total_anchors_analyzed = 0
+    # Histograms over the residues mod 210: anchor counts and gap sums
+    counts_mod_210 = np.zeros(210, dtype=np.int64)
+    gap_sums_mod_210 = np.zeros(210, dtype=np.int64)
     
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + START_INDEX
+    total_anchors_analyzed = loop_end_index - START_INDEX
     
-    for i in range(START_INDEX, loop_end_index):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - START_INDEX + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Time: {elapsed:.0f}s", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
-        gap_g_n = p_n_plus_1 - p_n
-        total_anchors_analyzed += 1
-
-        # --- Calculate Residues ---
-        residue_mod6 = anchor_S_n % 6
-        residue_mod30 = anchor_S_n % 30
-        residue_mod210 = anchor_S_n % 210
-
-        # --- Accumulate Stats ---
-        gap_stats_mod6[residue_mod6]['count'] += 1
-        gap_stats_mod6[residue_mod6]['gap_sum'] += gap_g_n
-
-        gap_stats_mod30[residue_mod30]['count'] += 1
-        gap_stats_mod30[residue_mod30]['gap_sum'] += gap_g_n
-
-        gap_stats_mod210[residue_mod210]['count'] += 1
-        gap_stats_mod210[residue_mod210]['gap_sum'] += gap_g_n
-            
+    def print_progress(block_stop):
+        elapsed = time.time() - start_time
+        progress = block_stop - START_INDEX
+        print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Time: {elapsed:.0f}s", end='\r')
+
+    blocks = imap_blocks(scan_anchor_block, load_worker_arrays, (PRIME_INPUT_FILE, loop_end_index),
+                         START_INDEX, loop_end_index, BLOCK_SIZE, print_progress)
+    for _, (counts, gap_sums) in blocks:
+        counts_mod_210 += counts
+        gap_sums_mod_210 += gap_sums
+
     print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Time: {time.time() - start_time:.0f}s   ")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
 
+    # --- Per-modulus histograms ---
+    counts_by_modulus = {m: fold_residues(counts_mod_210, m) for m in MODULI}
+    gap_sums_by_modulus = {m: fold_residues(gap_sums_mod_210, m) for m in MODULI}
+
     # --- Calculate Overall Average Gap ---
-    total_gap_sum = sum(stats['gap_sum'] for stats in gap_stats_mod6.values())
+    total_gap_sum = int(gap_sums_mod_210.sum())
     overall_avg_gap = total_gap_sum / total_anchors_analyzed if total_anchors_analyzed > 0 else 0
 
     # --- Final Reports ---
@@ -107,22 +134,19 @@ def run_PAC_gap_residue_correlation():
     print(f"Overall Average Prime Gap (g_n) in Range: {overall_avg_gap:.4f}")
 
     # --- Function to Print Table ---
-    def print_residue_report(modulus, gap_stats, overall_avg):
+    def print_residue_report(modulus, counts, gap_sums, overall_avg):
         print("\n" + "-" * 20 + f" Analysis for Mod {modulus} " + "-" * 20)
         print(f"{'Residue':<10} | {'Anchor Count':<15} | {'Avg Gap Size':<15} | {'vs Overall':<15}")
         print("-" * 60)
         
-        sorted_residues = sorted(gap_stats.keys())
-        
-        for residue in sorted_residues:
-            stats = gap_stats[residue]
-            count = stats['count']
+        for residue in range(modulus):
+            count = int(counts[residue])
             if count == 0:
                 # Optionally skip printing residues that never occur
                 # print(f"{residue:<10} | {0:<15,} | {'N/A':<15} | {'N/A':<15}")
                 continue 
                 
-            gap_sum = stats['gap_sum']
+            gap_sum = int(gap_sums[residue])
             avg_gap = gap_sum / count
             diff_percent = ((avg_gap / overall_avg) - 1) * 100 if overall_avg > 0 else 0
             
@@ -130,9 +154,8 @@ def run_PAC_gap_residue_correlation():
         print("-" * 60)
 
     # --- Print Reports for Mod 6, 30, 210 ---
-    print_residue_report(6, gap_stats_mod6, overall_avg_gap)
-    print_residue_report(30, gap_stats_mod30, overall_avg_gap)
-    print_residue_report(210, gap_stats_mod210, overall_avg_gap)
+    for modulus in MODULI:
+        print_residue_report(modulus, counts_by_modulus[modulus], gap_sums_by_modulus[modulus], overall_avg_gap)
 
     # --- Final Conclusion ---
     print("\n\n" + "="*20 + " FINAL CONCLUSION " + "="*20)
@@ -12,41 +12,85 @@
 
 import math
 import time
-from collections import defaultdict
+
+import numpy as np
+
+from pac_common import (
+    BLOCK_SIZE, SEARCH_LIMIT, cached_anchor_sums, cached_prime_gaps, cached_primes, check_search_coverage,
+    first_seen, imap_blocks, load_prime_arrays, most_frequent_first, nearest_prime_distance, primes_through, small_prime_table
+)
 
 # --- Configuration ---
 PRIME_INPUT_FILE = "primes_100m.txt"
 MAX_PRIME_PAIRS_TO_TEST = 50000000
 START_INDEX = 10 # Consistent start
 
+# K_IS_COMPOSITE[k] for every k <= SEARCH_LIMIT: 0 and 1 are not composite,
+# so skipped anchors (k_min == 0) never count as failures. At 2 KB the
+# table stays in L1, and the failure test is a single lookup per anchor.
+K_IS_COMPOSITE = ~small_prime_table(SEARCH_LIMIT)
+K_IS_COMPOSITE[:2] = False
+
 # --- Function to load primes from a file ---
 def load_primes_from_file(filename):
     """Loads ALL primes from the text file."""
     print(f"Loading ALL primes from {filename}...")
     start_time = time.time()
     try:
-        with open(filename, 'r') as f:
-            prime_list = [int(line.strip()) for line in f]
+        prime_list = cached_primes(filename)
     except FileNotFoundError:
         print(f"FATAL ERROR: The prime file '{filename}' was not found.")
-        return None, None
+        return None
     
-    prime_set = set(prime_list)
     end_time = time.time()
-    print(f"Loaded {len(prime_list):,} primes and created set in {end_time - start_time:.2f} seconds.")
+    print(f"Loaded {len(prime_list):,} primes in {end_time - start_time:.2f} seconds.")
     
     required_primes = MAX_PRIME_PAIRS_TO_TEST + START_INDEX + 10 # Need buffer for Sn+1
     if len(prime_list) < required_primes:
         print(f"\nFATAL ERROR: Prime file is too small.")
-        return None, None
+        return None
         
-    return prime_list, prime_set
+    return prime_list
+
+# --- Anchor kernel for a block of indices ---
+def scan_anchor_block(prime_list, anchors_arr, gaps_arr, start, stop):
+    """
+    Runs the Law I search over the anchors S_i for start <= i < stop.
+    Returns (gap_sum, counts, gap_sums, first): the sum of every gap g_i in
+    the block, per-k_min histograms of the failures and of their gaps g_n,
+    and the position of each k_min's first failure within the block.
+    """
+    anchors = anchors_arr[start:stop]
+    gaps = gaps_arr[start:stop]
+
+    # --- Find the Law I k_min ---
+    min_distance_k, _ = nearest_prime_distance(prime_list, anchors)
+    # Nothing within the search limit: the anchor is skipped
+    min_distance_k[min_distance_k > SEARCH_LIMIT] = 0
+
+    # --- Check if it's a composite failure ---
+    is_k_composite = K_IS_COMPOSITE[min_distance_k]
+    k_values = min_distance_k[is_k_composite]
+    counts = np.bincount(k_values, minlength=SEARCH_LIMIT + 1)
+    # Gap sums stay far below 2^53, so the float64 weights sum exactly
+    gap_sums = np.bincount(k_values, weights=gaps[is_k_composite], minlength=SEARCH_LIMIT + 1).astype(np.int64)
+    return int(gaps.sum()), counts, gap_sums, first_seen(k_values, SEARCH_LIMIT + 1)
+
+# --- Per-worker arrays of the block kernel ---
+# Workers send back only each block's failure histograms.
+def load_worker_arrays(primes_path, primes_count, anchors_count):
+    """Returns the (primes, anchors, gaps) arguments of scan_anchor_block()."""
+    primes_arr, anchors_arr = load_prime_arrays(primes_path, primes_count, anchors_count)
+    return primes_arr, anchors_arr, cached_prime_gaps(primes_path)[:anchors_count]
 
 # --- Main Testing Logic ---
 def run_PAC_failure_gap_correlation():
     
-    prime_list, prime_set = load_primes_from_file(PRIME_INPUT_FILE)
+    prime_list = load_primes_from_file(PRIME_INPUT_FILE)
     if prime_list is None: return
+    anchors_arr = cached_anchor_sums(PRIME_INPUT_FILE)
+    # Build (or map) the gap cache once, before the workers do
+    cached_prime_gaps(PRIME_INPUT_FILE)
 
     print(f"\nStarting PAC Failure Type vs. Gap Correlation for {MAX_PRIME_PAIRS_TO_TEST:,} S_n pairs...")
     print(f"  - Calculating average gap g_n associated with each composite k_min failure type.")
@@ -55,58 +99,43 @@ def run_PAC_failure_gap_correlation():
     
     # --- Data structures for the test ---
     total_law_I_failures = 0
-    # Store {k_composite: {'count': N, 'gap_sum': total_gap}}
-    gap_stats_by_k = defaultdict(lambda: {'count': 0, 'gap_sum': 0})
+    # Histograms indexed by k_composite (k_min never exceeds SEARCH_LIMIT):
+    # occurrence counts and the sum of the gaps g_n of those failures
+    counts_k = np.zeros(SEARCH_LIMIT + 1, dtype=np.int64)
+    gap_sums_k = np.zeros(SEARCH_LIMIT + 1, dtype=np.int64)
+    # Position of each k's first failure in scan order, for the report's tie order
+    first_seen_k = np.zeros(SEARCH_LIMIT + 1, dtype=np.int64)
     
     total_gap_sum_overall = 0 # To calculate overall average gap
     total_anchors_analyzed = 0
     
     loop_end_index = MAX_PRIME_PAIRS_TO_TEST + START_INDEX
+    if not check_search_coverage(prime_list, anchors_arr, START_INDEX, loop_end_index):
+        return # Stop execution if primes are insufficient
     
-    for i in range(START_INDEX, loop_end_index):
-        if i % 100000 == 0:
-            elapsed = time.time() - start_time
-            progress = i - START_INDEX + 1
-            print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Time: {elapsed:.0f}s", end='\r')
-
-        p_n = prime_list[i]
-        p_n_plus_1 = prime_list[i+1]
-        anchor_S_n = p_n + p_n_plus_1
-        gap_g_n = p_n_plus_1 - p_n
-        
-        total_anchors_analyzed += 1
-        total_gap_sum_overall += gap_g_n
+    # Workers only see the primes up to the last anchor's search window
+    upper = int(anchors_arr[loop_end_index - 1]) + SEARCH_LIMIT
+    primes_count = primes_through(prime_list, upper)
+
+    def print_progress(block_stop):
+        elapsed = time.time() - start_time
+        progress = block_stop - START_INDEX
+        print(f"Progress: {progress:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Time: {elapsed:.0f}s", end='\r')
+
+    blocks = imap_blocks(scan_anchor_block, load_worker_arrays, (PRIME_INPUT_FILE, primes_count, loop_end_index),
+                         START_INDEX, loop_end_index, BLOCK_SIZE, print_progress)
+    for (block_start, block_stop), block_result in blocks:
+        gap_sum, counts, gap_sums, first = block_result
+        total_anchors_analyzed += block_stop - block_start
+        total_gap_sum_overall += gap_sum
+
+        # --- Record the gaps associated with each k_min value ---
+        new_k = (counts > 0) & (counts_k == 0)
+        first_seen_k[new_k] = first[new_k] + total_law_I_failures
+        counts_k += counts
+        gap_sums_k += gap_sums
+        total_law_I_failures += int(counts.sum())
 
-        # --- Find the Law I k_min ---
-        min_distance_k = 0
-        search_dist = 1
-        
-        while True:
-            q_lower = anchor_S_n - search_dist
-            q_upper = anchor_S_n + search_dist
-
-            if q_lower in prime_set:
-                min_distance_k = search_dist
-                break
-            if q_upper in prime_set:
-                min_distance_k = search_dist
-                break
-                
-            search_dist += 1
-            if search_dist > 2000: break 
-        
-        if min_distance_k == 0: continue 
-
-        # --- Check if it's a composite failure ---
-        is_k_composite = (min_distance_k > 1) and (min_distance_k not in prime_set)
-        
-        if is_k_composite:
-            total_law_I_failures += 1
-            
-            # --- Record the gap associated with this k_min value ---
-            gap_stats_by_k[min_distance_k]['count'] += 1
-            gap_stats_by_k[min_distance_k]['gap_sum'] += gap_g_n
-            
     print(f"Progress: {MAX_PRIME_PAIRS_TO_TEST:,} / {MAX_PRIME_PAIRS_TO_TEST:,} | Law I Fails: {total_law_I_failures:,} | Time: {time.time() - start_time:.0f}s   ")
     print(f"\nAnalysis completed in {time.time() - start_time:.2f} seconds.")
     print("-" * 80)
@@ -124,29 +153,23 @@ def run_PAC_failure_gap_correlation():
     print(f"{'Comp k_min':<12} | {'Occurrence Count':<18} | {'Avg Gap Size (g_n)':<20} | {'vs Overall':<15}")
     print("-" * 70)
     
-    # Sort k values by occurrence count (most frequent first)
-    sorted_k_stats = sorted(gap_stats_by_k.items(), key=lambda item: item[1]['count'], reverse=True)
+    # Sort the observed k values by occurrence count (most frequent first);
+    # equal counts keep the order in which the k values were first seen
+    sorted_k = most_frequent_first(counts_k, first_seen_k)
     
     # Print stats for the top 20 most frequent composite k values
-    printed_count = 0
-    for k, stats in sorted_k_stats:
-        if printed_count >= 20:
-             break
-             
-        count = stats['count']
-        if count == 0: continue # Should not happen, but safety check
-            
-        gap_sum = stats['gap_sum']
+    for k in sorted_k[:20].tolist():
+        count = int(counts_k[k])
+        gap_sum = int(gap_sums_k[k])
         avg_gap = gap_sum / count
         diff_percent = ((avg_gap / overall_avg_gap) - 1) * 100 if overall_avg_gap > 0 else 0
         
         print(f"{k:<12} | {count:<18,} | {avg_gap:<20.4f} | {diff_percent:+.2f}%")
-        printed_count += 1
 
     # Optionally, summarize the rest
-    if len(sorted_k_stats) > 20:
-        remaining_count = sum(stats['count'] for k, stats in sorted_k_stats[20:])
-        remaining_gap_sum = sum(stats['gap_sum'] for k, stats in sorted_k_stats[20:])
+    if len(sorted_k) > 20:
+        remaining_count = int(counts_k[sorted_k[20:]].sum())
+        remaining_gap_sum = int(gap_sums_k[sorted_k[20:]].sum())
         if remaining_count > 0:
              avg_gap_remaining = remaining_gap_sum / remaining_count
              diff_percent_remaining = ((avg_gap_remaining / overall_avg_gap) - 1) * 100 if overall_avg_gap > 0 else 0